@@ -3,7 +3,10 @@ Created the 26/11/2024
 
 @author: Louis Grandvaux
 """
-from typing import Tuple
+from functools import lru_cache
+from typing import TYPE_CHECKING, Tuple
+
+import numpy as np
 
 from pymodaq.control_modules.move_utility_classes import (
     DAQ_Move_base,
@@ -16,51 +19,69 @@ from pymodaq.utils.parameter import Parameter
 
 from pymeasure.adapters import VISAAdapter, PrologixAdapter
 
-import pyvisa
+from pymodaq_plugins_signal_recovery.hardware.utils import (
+    DEFAULT_CHUNK_SIZE, VisaParams, get_dsp7265, set_chunk_size)
+
+if TYPE_CHECKING:
+    from pymodaq_plugins_signal_recovery.hardware.dsp_7265_thread_safe import \
+        DSP7265ThreadSafe
+
 
-from pymodaq_plugins_signal_recovery.hardware.dsp_7265_thread_safe import DSP7265ThreadSafe
+@lru_cache(maxsize=None)
+def _build_dict_from_float_tuple(values: tuple, unit: str) -> dict:
+    return {f"{v:.2e} {unit}": v for v in values}
 
 
 def build_dict_from_float_list(
         time_constants: list[float],
         unit: str = "") -> dict:
-    d = {}
-    for tc in time_constants:
-        d[f"{tc:.2e} {unit}"] = tc
-    return d
+    return dict(_build_dict_from_float_tuple(tuple(time_constants), unit))
 
 
-rm = pyvisa.ResourceManager()
-VISA_RESOURCES = rm.list_resources()
 ADAPTERS = dict(VISA=VISAAdapter, Prologix=PrologixAdapter)
 FET = {"Bipolar": 0, "FET": 1}
 SHIELD = {"Grounded": 0, "Floating": 1}
 COUPLING = {"AC": 0, "DC": 1}
-TIME_CONSTANTS = build_dict_from_float_list(DSP7265ThreadSafe.TIME_CONSTANTS, "s")
 GAIN = list(range(0, 100, 10))
-
-
-class DAQ_Move_Lockin_DSP7265(DAQ_Move_base):
-    """Plugin for the Signal Recovery DSP 7265 Instrument
-
-    Does not currently support differential measurement.
-    """
-
-    _controller_units = 'Hz'
-    is_multiaxes = True
-    _axis_names = ['OSC']
-    _epsilon = 0.01
-    data_actuator_type = DataActuatorType.DataActuator
-
-    params = [
+# Filled by build_tables from the class attributes of the instrument
+TIME_CONSTANTS: dict = {}
+SENS_BY_IMODE: dict = {}
+SENS_KEYS_BY_IMODE: dict = {}
+
+
+def build_tables() -> None:
+    """Build the time constant and sensitivity tables of the DSP7265"""
+    if TIME_CONSTANTS:
+        return
+    dsp = get_dsp7265()
+    TIME_CONSTANTS.update(build_dict_from_float_list(dsp.TIME_CONSTANTS, "s"))
+    sensitivities = np.asarray(dsp.SENSITIVITIES, dtype=np.float64)
+    SENS_BY_IMODE.update({
+        dsp.IMODES[i]: build_dict_from_float_list(
+            (sensitivities * dsp.SEN_MULTIPLIER[i]).tolist(),
+            unit
+        )
+        for i, unit in enumerate(("V", "A", "A"))
+    })
+    SENS_KEYS_BY_IMODE.update(
+        {k: list(v.keys()) for k, v in SENS_BY_IMODE.items()})
+
+
+def build_params(cls: type) -> list:
+    """Build the params of the actuator once the driver is loaded"""
+    build_tables()
+    dsp = get_dsp7265()
+    return [
         {'title': 'Adapter', 'name': 'adapter', 'type': 'list',
          'limits': list(ADAPTERS.keys())},
         {'title': 'VISA Address:', 'name': 'address', 'type': 'list',
-         'limits': VISA_RESOURCES},
+         'limits': []},
+        {'title': 'VISA chunk size (bytes):', 'name': 'chunk_size',
+         'type': 'int', 'value': DEFAULT_CHUNK_SIZE, 'min': 1024},
         {'title': 'Input mode', 'name': 'imode', 'type': 'list',
-         'limits': DSP7265ThreadSafe.IMODES},
+         'limits': dsp.IMODES},
         {'title': 'Reference', 'name': 'reference', 'type': 'list',
-         'limits': DSP7265ThreadSafe.REFERENCES},
+         'limits': dsp.REFERENCES},
         {'title': 'Voltage mode input device', 'name': 'fet', 'type': 'list',
          'limits': list(FET.keys())},
         {'title': 'Input connector shield', 'name': 'shield', 'type': 'list',
@@ -71,14 +92,52 @@ class DAQ_Move_Lockin_DSP7265(DAQ_Move_base):
          'type': 'list', 'limits': list(TIME_CONSTANTS.keys())},
         {'title': 'Full-scale sensitivity', 'name': 'sensitivity',
          'type': 'list', 'limits':
-         list(build_dict_from_float_list(DSP7265ThreadSafe.SENSITIVITIES, 'V'))},
+         SENS_KEYS_BY_IMODE[dsp.IMODES[0]]},
         {'title': 'Voltage (V)', 'name': 'voltage', 'type': 'float',
          'limits': [0, 5], 'value': 1e-6},
         {'title': 'Gain (dB)', 'name': 'gain', 'type': 'list', 'limits': GAIN}
-    ] + comon_parameters_fun(is_multiaxes, axis_names=_axis_names, epsilon=_epsilon)
+    ] + comon_parameters_fun(cls.is_multiaxes, axis_names=cls._axis_names,
+                             epsilon=cls._epsilon)
+
+
+class DAQ_Move_Lockin_DSP7265(DAQ_Move_base):
+    """Plugin for the Signal Recovery DSP 7265 Instrument
+
+    Does not currently support differential measurement.
+    """
+
+    _controller_units = 'Hz'
+    is_multiaxes = True
+    _axis_names = ['OSC']
+    _epsilon = 0.01
+    data_actuator_type = DataActuatorType.DataActuator
+
+    params = VisaParams(build_params)
 
     def ini_attributes(self) -> None:
-        self.controller: DSP7265ThreadSafe = None
+        self.controller: 'DSP7265ThreadSafe' = None
+        self._imode_param: Parameter = self.settings.child('imode')
+        self._sens_param: Parameter = self.settings.child('sensitivity')
+        self._handlers = {
+            "imode": self._on_imode,
+            "reference": lambda p: setattr(
+                self.controller, 'reference', p.value()),
+            "fet": lambda p: setattr(
+                self.controller, 'fet', FET[p.value()]),
+            "shield": lambda p: setattr(
+                self.controller, 'shield', SHIELD[p.value()]),
+            "coupling": lambda p: setattr(
+                self.controller, 'coupling', COUPLING[p.value()]),
+            "time_constant": lambda p: setattr(
+                self.controller, 'time_constant', TIME_CONSTANTS[p.value()]),
+            "sensitivity": self._on_sensitivity,
+            "voltage": lambda p: setattr(
+                self.controller, 'voltage', p.value()),
+            "gain": lambda p: setattr(
+                self.controller, 'gain', p.value()),
+            "chunk_size": lambda p: set_chunk_size(
+                self.controller.adapter, p.value()),
+        }
 
     def get_actuator_value(self) -> DataActuator:
         """Get the current value from the hardware with scaling conversion.
@@ -104,67 +163,19 @@ class DAQ_Move_Lockin_DSP7265(DAQ_Move_base):
             A given parameter (within detector_settings) whose value has been
             changed by the user
         """
-        if param.name() == "imode":
-            self.controller.imode = param.value()
-            if param.value() == DSP7265ThreadSafe.IMODES[0]:
-                self.settings.child('sensitivity').setLimits(
-                    list(build_dict_from_float_list(
-                        [s * DSP7265ThreadSafe.SEN_MULTIPLIER[0]
-                         for s in DSP7265ThreadSafe.SENSITIVITIES],
-                        "V"
-                    ).keys())
-                )
-            elif param.value() == DSP7265ThreadSafe.IMODES[1]:
-                self.settings.child('sensitivity').setLimits(
-                    list(build_dict_from_float_list(
-                        [s * DSP7265ThreadSafe.SEN_MULTIPLIER[1]
-                         for s in DSP7265ThreadSafe.SENSITIVITIES],
-                        "A"
-                    ).keys())
-                )
-            elif param.value() == DSP7265ThreadSafe.IMODES[2]:
-                self.settings.child('sensitivity').setLimits(
-                    list(build_dict_from_float_list(
-                        [s * DSP7265ThreadSafe.SEN_MULTIPLIER[2]
-                         for s in DSP7265ThreadSafe.SENSITIVITIES],
-                        "A"
-                    ).keys())
-                )
-        elif param.name() == "reference":
-            self.controller.reference = param.value()
-        elif param.name() == "fet":
-            self.controller.fet = FET[param.value()]
-        elif param.name() == "shield":
-            self.controller.shield = SHIELD[param.value()]
-        elif param.name() == "coupling":
-            self.controller.coupling = COUPLING[param.value()]
-        elif param.name() == "time_constant":
-            self.controller.time_constant = TIME_CONSTANTS[param.value()]
-        elif param.name() == "sensitivity":
-            if self.settings.child('imode').value() == DSP7265ThreadSafe.IMODES[0]:
-                self.controller.sensitivity = build_dict_from_float_list(
-                    [s * DSP7265ThreadSafe.SEN_MULTIPLIER[0]
-                     for s in DSP7265ThreadSafe.SENSITIVITIES],
-                    "V"
-                )[self.settings.child('sensitivity').value()]
-            if self.settings.child('imode').value() == DSP7265ThreadSafe.IMODES[1]:
-                self.controller.sensitivity = build_dict_from_float_list(
-                    [s * DSP7265ThreadSafe.SEN_MULTIPLIER[1]
-                     for s in DSP7265ThreadSafe.SENSITIVITIES],
-                    "A"
-                )[self.settings.child('sensitivity').value()]
-            if self.settings.child('imode').value() == DSP7265ThreadSafe.IMODES[2]:
-                self.controller.sensitivity = build_dict_from_float_list(
-                    [s * DSP7265ThreadSafe.SEN_MULTIPLIER[2]
-                     for s in DSP7265ThreadSafe.SENSITIVITIES],
-                    "A"
-                )[self.settings.child('sensitivity').value()]
-        elif param.name() == "voltage":
-            self.controller.voltage = param.value()
-        elif param.name() == "gain":
-            self.controller.gain = param.value()
-        else:
-            pass
+        handler = self._handlers.get(param.name())
+        if handler is not None:
+            handler(param)
+
+    def _on_imode(self, param: Parameter) -> None:
+        """Set the input mode and update the available sensitivities"""
+        self.controller.imode = param.value()
+        self._sens_param.setLimits(SENS_KEYS_BY_IMODE[param.value()])
+
+    def _on_sensitivity(self, param: Parameter) -> None:
+        """Set the sensitivity according to the current input mode"""
+        self.controller.sensitivity = SENS_BY_IMODE[
+            self._imode_param.value()][param.value()]
 
     def ini_stage(self, controller: object = None) -> Tuple[str, bool]:
         """Actuator communication initialization
@@ -185,12 +196,15 @@ class DAQ_Move_Lockin_DSP7265(DAQ_Move_base):
             Controller of the daq_move
         """
         self.ini_stage_init(slave_controller=controller)
+        build_tables()
 
         if self.is_master:
             adapter = ADAPTERS[self.settings.child('adapter').value()](
                 self.settings.child('address').value()
             )
-            self.controller = DSP7265ThreadSafe(adapter)
+            self.controller = get_dsp7265()(adapter)
+            set_chunk_size(self.controller.adapter,
+                           self.settings.child('chunk_size').value())
 
         try:
             info = self.controller.id
@@ -208,12 +222,8 @@ class DAQ_Move_Lockin_DSP7265(DAQ_Move_base):
         ----------
         value: (float) value of the absolute target value
         """
-        f = self.check_bound(f)
-        f = self.set_position_with_scaling(f)
-        self.controller.frequency = f.value()
-
-        self.target_value = f
-        self.current_value = self.target_value
+        self.target_value = self.check_bound(f)
+        self._apply_frequency(self.target_value)
 
     def move_rel(self, f: DataActuator) -> None:
         """ Move the actuator to the relative target actuator value defined by
@@ -226,8 +236,17 @@ class DAQ_Move_Lockin_DSP7265(DAQ_Move_base):
         f = (self.check_bound(self.current_value + f)
              - self.current_value)
         self.target_value = f + self.current_value
-        f = self.set_position_relative_with_scaling(f)
-        self.move_abs(self.target_value)
+        self._apply_frequency(self.target_value)
+
+    def _apply_frequency(self, f: DataActuator) -> None:
+        """Write an already bounded target frequency to the lockin
+
+        Parameters
+        ----------
+        f: (DataActuator) target frequency before scaling conversion
+        """
+        self.controller.frequency = self.set_position_with_scaling(f).value()
+        self.current_value = self.target_value
 
     def move_home(self):
         """Call the reference method of the controller
@@ -3,9 +3,8 @@ Created the 27/11/2024
 
 @author: Louis Grandvaux
 """
-from typing import Tuple
+from typing import TYPE_CHECKING, Tuple
 
-import pyvisa
 import numpy as np
 
 from pymeasure.adapters import VISAAdapter, PrologixAdapter
@@ -21,15 +20,19 @@ from pymodaq.utils.data import DataFromPlugins, DataToExport
 from pyqtgraph.parametertree.Parameter import registerParameterType
 from pyqtgraph.parametertree.parameterTypes.basetypes import GroupParameter
 
-from pymodaq_plugins_signal_recovery.hardware.dsp_7265_thread_safe import DSP7265ThreadSafe
+from pymodaq_plugins_signal_recovery.hardware.utils import (
+    DEFAULT_CHUNK_SIZE, VisaParams, get_dsp7265, set_chunk_size)
 
-CHANNELS = ['x', 'y', 'mag', 'phase', 'adc1', 'adc2', 'adc3']
-rm = pyvisa.ResourceManager()
-VISA_RESOURCES = rm.list_resources()
-ADAPTERS = dict(VISA=VISAAdapter, Prologix=PrologixAdapter)
+if TYPE_CHECKING:
+    from pymodaq_plugins_signal_recovery.hardware.dsp_7265_thread_safe import \
+        DSP7265ThreadSafe
 
-for channel in CHANNELS:
-    assert hasattr(DSP7265ThreadSafe, channel)
+CHANNELS = ('x', 'y', 'mag', 'phase', 'adc1', 'adc2', 'adc3')
+CHANNEL_PREFIX = 'channel'
+CHILD_TEMPLATE = {'type': 'itemselect', 'removable': True}
+ADAPTERS = dict(VISA=VISAAdapter, Prologix=PrologixAdapter)
+# Commands reading a pair of channels in a single transaction
+PAIR_QUERIES = {('x', 'y'): 'XY.', ('mag', 'phase'): 'MP.'}
 
 
 class ChannelGroup(GroupParameter):
@@ -39,27 +42,27 @@ class ChannelGroup(GroupParameter):
     def __init__(self, **opts) -> None:
         opts['type'] = 'dsp7265channel'
         opts['addText'] = "Add Channel"
+        self._next_index = 0
         super().__init__(**opts)
 
+    def insertChild(self, pos, child, *args, **kwargs):
+        """Keep the index of the next channel above the existing ones
+        """
+        child = super().insertChild(pos, child, *args, **kwargs)
+        suffix = child.name()[len(CHANNEL_PREFIX):]
+        if child.name().startswith(CHANNEL_PREFIX) and suffix.isdigit():
+            self._next_index = max(self._next_index, int(suffix) + 1)
+        return child
+
     def addNew(self) -> None:
         """Add new channel to viewer
         """
-        name_prefix = 'channel'
-
-        child_indexes = [int(par.name()[len(name_prefix) + 1:])
-                         for par in self.children()]
-
-        if child_indexes == []:
-            newindex = 0
-        else:
-            newindex = max(child_indexes) + 1
-
+        newindex = self._next_index
         child = {
+            **CHILD_TEMPLATE,
             'title': f'Measure {newindex:02.0f}',
-            'name': f'{name_prefix}{newindex:02.0f}',
-            'type': 'itemselect',
-            'removable': True,
-            'value': dict(all_items=CHANNELS, selected=CHANNELS[0])
+            'name': f'{CHANNEL_PREFIX}{newindex:02.0f}',
+            'value': dict(all_items=list(CHANNELS), selected=CHANNELS[0])
         }
 
         self.addChild(child)
@@ -72,17 +75,43 @@ class DAQ_0DViewer_Lockin_DSP7265(DAQ_Viewer_base):
     """DAQ_viewer for DSP 7265 lockin
     """
 
-    params = [
+    params = VisaParams([
         {'title': 'Adapter', 'name': 'adapter', 'type': 'list',
          'limits': list(ADAPTERS.keys())},
         {'title': 'VISA Address:', 'name': 'address', 'type': 'list',
-         'limits': VISA_RESOURCES},
+         'limits': []},
+        {'title': 'VISA chunk size (bytes):', 'name': 'chunk_size',
+         'type': 'int', 'value': DEFAULT_CHUNK_SIZE, 'min': 1024},
         {'title': 'ID:', 'name': 'id', 'type': 'str'},
-        {'title': 'Channels:', 'name': 'channels', 'type': 'dsp7270channel'}
-    ] + comon_parameters
+        {'title': 'Channels:', 'name': 'channels', 'type': 'dsp7265channel'}
+    ] + comon_parameters)
 
     def ini_attributes(self) -> None:
-        self.controller: DSP7265ThreadSafe = None
+        self.controller: 'DSP7265ThreadSafe' = None
+        self._channel_names: set[str] = set()
+        self._layout: list[tuple[str, list[str]]] = []
+        self._labels: set[str] = set()
+        self._channels_param: Parameter = self.settings.child('channels')
+        self._channels_param.sigChildAdded.connect(self._update_channels)
+        self._channels_param.sigChildRemoved.connect(self._update_channels)
+        self._update_channels()
+
+    def _update_channels(self, *args) -> None:
+        """Cache the names of the channels parameters and their layout"""
+        self._channel_names = set(
+            utils.iter_children(self._channels_param, []))
+        self._update_layout()
+
+    def _update_layout(self) -> None:
+        """Cache the selected labels of each channel and their union"""
+        self._layout = []
+        for child in self._channels_param.children():
+            selected = child.value()['selected']
+            if isinstance(selected, str):
+                selected = [selected]
+            self._layout.append((child.name(), list(selected)))
+        self._labels = {label for _, labels in self._layout
+                        for label in labels}
 
     def commit_settings(self, param: Parameter) -> None:
         """Apply the consequences of a change of value in the detector settings
@@ -93,23 +122,23 @@ class DAQ_0DViewer_Lockin_DSP7265(DAQ_Viewer_base):
             A given parameter (within detector_settings) whose value has been
             changed by the user
         """
-        if param.name() in utils.iter_children(
-                self.settings.child('channels'), []):
-            data = []
-            for child in self.settings.child('channels').children():
-                labels = child.value()['selected']
-                data.append(
-                    DataFromPlugins(
-                        name=child.name(),
-                        data=[np.array([0]) for _ in labels],
-                        labels=labels,
-                        dim='Data0D'
-                    )
+        if param.name() in self._channel_names:
+            self._update_layout()
+            data = [
+                DataFromPlugins(
+                    name=name,
+                    data=[np.array([0]) for _ in labels],
+                    labels=labels,
+                    dim='Data0D'
                 )
+                for name, labels in self._layout
+            ]
             self.dte_signal_temp.emit(DataToExport(
                 name="lockindsp7265",
                 data=data
             ))
+        elif param.name() == "chunk_size":
+            set_chunk_size(self.controller.adapter, param.value())
 
     def ini_detector(self, controller: object = None) -> Tuple[str, bool]:
         """Viewer communication initialization
@@ -135,7 +164,12 @@ class DAQ_0DViewer_Lockin_DSP7265(DAQ_Viewer_base):
             adapter = ADAPTERS[self.settings.child('adapter').value()](
                 self.settings.child('address').value()
             )
-            self.controller = DSP7265ThreadSafe(adapter)
+            dsp = get_dsp7265()
+            for channel in CHANNELS:
+                assert hasattr(dsp, channel)
+            self.controller = dsp(adapter)
+            set_chunk_size(self.controller.adapter,
+                           self.settings.child('chunk_size').value())
 
         self.dte_signal_temp.emit(
             DataToExport(
@@ -173,22 +207,38 @@ class DAQ_0DViewer_Lockin_DSP7265(DAQ_Viewer_base):
             Naverage (int, optional): Number of averaging if available.
             Defaults to 1.
         """
-        data = []
-        for child in self.settings.child('channels').children():
-            labels = child.value()['selected'][:]
-            subdata = [np.array([getattr(self.controller, label)])
-                       for label in labels]
-            data.append(DataFromPlugins(
-                name=child.name(),
-                data=subdata,
-                labels=labels,
+        values = self._read_channels(self._labels)
+        data = [
+            DataFromPlugins(
+                name=name,
+                data=[np.array([values[label]]) for label in labels],
+                labels=labels[:],
                 dim='Data0D'
-            ))
+            )
+            for name, labels in self._layout
+        ]
         self.dte_signal.emit(DataToExport(
             name="lockindsp7265",
             data=data
         ))
 
+    def _read_channels(self, labels: set) -> dict:
+        """Read each selected channel once
+
+        Pairs of channels listed in PAIR_QUERIES are read with a single
+        command, the others (or a pair whose reply failed) through their
+        controller attribute.
+        """
+        values = {}
+        for pair, command in PAIR_QUERIES.items():
+            if labels.issuperset(pair):
+                reply = self.controller.ask(command)
+                if reply is not None:
+                    values.update(zip(pair, np.fromstring(reply, sep=',')))
+        for label in labels.difference(values):
+            values[label] = getattr(self.controller, label)
+        return values
+
 
 if __name__ == '__main__':
     main(__file__, init=False)
@@ -4,7 +4,7 @@ from pymodaq.utils.data import DataFromPlugins
 from pymodaq.control_modules.viewer_utility_classes import DAQ_Viewer_base, comon_parameters, main
 from pymodaq.utils.parameter import Parameter, utils
 
-from pymodaq_plugins_signal_recovery.hardware.utils import get_resources
+from pymodaq_plugins_signal_recovery.hardware.utils import VisaParams
 from pymeasure.instruments.ametek.ametek7270 import Ametek7270
 from pyqtgraph.parametertree.Parameter import registerParameterType
 from pyqtgraph.parametertree.parameterTypes.basetypes import GroupParameter
@@ -50,11 +50,11 @@ registerParameterType('dsp7270channel', ChannelGroup, override=True)
 class DAQ_0DViewer_Lockin_DSP7270(DAQ_Viewer_base):
     """
     """
-    params = comon_parameters + [
-        {'title': 'Address:', 'name': 'address', 'type': 'list', 'limits': get_resources()},
+    params = VisaParams(comon_parameters + [
+        {'title': 'Address:', 'name': 'address', 'type': 'list', 'limits': []},
         {'title': 'ID:', 'name': 'id', 'type': 'str'},
         {'title': 'Channels:', 'name': 'channels', 'type': 'dsp7270channel'}
-        ]
+        ])
 
     def ini_attributes(self):
         self.controller: Ametek7270 = None
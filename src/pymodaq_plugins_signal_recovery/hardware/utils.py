@@ -4,13 +4,73 @@ Created the 17/04/2023
 
 @author: Sebastien Weber
 """
-from typing import Tuple
+from typing import Callable, List, Optional, Tuple, Union
 from pyvisa import ResourceManager
 
+# Default read chunk of pyvisa, enough for the short ASCII replies of the lockins
+DEFAULT_CHUNK_SIZE = 20 * 1024
 
-def get_resources() -> Tuple[str]:
+_resource_manager: Optional[ResourceManager] = None
+_visa_resources: Optional[Tuple[str]] = None
 
-    rm = ResourceManager()
-    resources = rm.list_resources('?*')
-    rm.close()
-    return resources
+
+def get_resource_manager() -> ResourceManager:
+    """Get the VISA ResourceManager shared by all the plugins of this package"""
+    global _resource_manager
+    if _resource_manager is None:
+        _resource_manager = ResourceManager()
+    return _resource_manager
+
+
+def get_visa_resources() -> Tuple[str]:
+    """List all the VISA resources, enumerating the buses only on first call"""
+    global _visa_resources
+    if _visa_resources is None:
+        _visa_resources = get_resource_manager().list_resources('?*')
+    return _visa_resources
+
+
+def get_dsp7265() -> type:
+    """Get the thread safe DSP7265 driver, importing pymeasure on first call
+
+    Keeps the pymeasure instruments out of the plugin discovery of PyMoDAQ.
+    """
+    from pymodaq_plugins_signal_recovery.hardware.dsp_7265_thread_safe import \
+        DSP7265ThreadSafe
+    return DSP7265ThreadSafe
+
+
+def set_chunk_size(adapter, chunk_size: int) -> None:
+    """Set the size of the VISA read chunks of a pymeasure adapter
+
+    pyvisa allocates a buffer of this size on each read, so it should only
+    be raised for long replies. Adapters without a VISA connection are left
+    untouched.
+    """
+    connection = getattr(adapter, 'connection', None)
+    if hasattr(connection, 'chunk_size'):
+        connection.chunk_size = chunk_size
+
+
+class VisaParams:
+    """Class attribute holding a plugin params list whose 'address' limits
+    are only filled with the VISA resources when the params are first read
+
+    PyMoDAQ reads the params of a plugin class when the plugin is selected
+    in the GUI, so the buses are not enumerated at import time. The params
+    may also be given as a callable taking the plugin class, to defer their
+    construction to the first read as well.
+    """
+
+    def __init__(self, params: Union[List[dict], Callable[[type], List[dict]]],
+                 address: str = 'address') -> None:
+        self._params = params
+        self._address = address
+
+    def __get__(self, obj, objtype=None) -> List[dict]:
+        if callable(self._params):
+            self._params = self._params(objtype)
+        for param in self._params:
+            if param.get('name') == self._address:
+                param['limits'] = get_visa_resources()
+        return self._params